@@ -1,75 +1,190 @@
 import os
+import re
+import errno
+import heapq
 import magic
 import stat
-from collections import defaultdict
+import sys
+import threading
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress, islice, repeat
+from operator import and_, gt, itemgetter
+
+# Number of bytes handed to libmagic when the extension is unknown
+HEADER_SIZE = 2048
+
+# Reciprocal of 1 MB, exact since it is a power of two, so sizes are scaled without a division
+MB_PER_BYTE = 1 / (1024 * 1024)
+
+# Number of files enumerated and classified at once, bounds memory used by traversal
+BATCH_SIZE = 4096
+
+# Linux only, on other platforms files are opened with the default flags
+O_NOATIME = getattr(os, 'O_NOATIME', 0)
 
 
 class FileSystemAnalyzer:
-    def __init__(self, directory: str, size_threshold: int = 100 * 1024 * 1024):
+    # Categories of common extensions, known without reading the file
+    _EXT_CATEGORY = {
+        '.txt': 'Text', '.md': 'Text', '.csv': 'Text', '.log': 'Text', '.json': 'Text', '.xml': 'Text',
+        '.html': 'Text', '.css': 'Text', '.py': 'Text', '.c': 'Text', '.h': 'Text',
+        '.png': 'Image', '.jpg': 'Image', '.jpeg': 'Image', '.gif': 'Image', '.bmp': 'Image',
+        '.tif': 'Image', '.tiff': 'Image', '.webp': 'Image',
+        '.mp4': 'Video', '.mkv': 'Video', '.avi': 'Video', '.mov': 'Video', '.webm': 'Video',
+        '.mp3': 'Audio', '.wav': 'Audio', '.flac': 'Audio', '.ogg': 'Audio', '.m4a': 'Audio',
+        '.pdf': 'PDF',
+        '.exe': 'Executable', '.dll': 'Executable', '.so': 'Executable',
+    }
+
+    # Mapping mime types to categories, one group per category
+    _MIME_PATTERN = re.compile(r'(text)|(image)|(exec)|(video)|(audio)|(application/pdf)')
+    _MIME_CATEGORIES = ('Text', 'Image', 'Executable', 'Video', 'Audio', 'PDF')
+
+    def __init__(self, directory: str, size_threshold: int = 100 * 1024 * 1024, max_workers: int = None,
+                 cache_by_extension: bool = True, skip_classify_under: int = 0):
         """
         Initialize the File System Analyzer
 
         :param directory: directory to analyze
         :param size_threshold: minimum file size to be considered large (default: 100 MB)
+        :param max_workers: number of threads used to classify files (default: min(32, 4 * CPU count))
+        :param cache_by_extension: reuse the libmagic result of the first file with the same extension (default: True)
+        :param skip_classify_under: files smaller than this size in bytes are counted as 'Small' without
+                                    classification (default: 0, classify every file)
         """
         self.directory = os.path.abspath(directory)         # normalized absolutized version of the pathname path
         self.size_threshold = size_threshold
-        self.file_type_magic = magic.Magic(mime=True)
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._magic_local = threading.local()        # libmagic handles are created lazily, one per thread
+        self.cache_by_extension = cache_by_extension
+        self._ext_cache = {}
+        self._open_flags = O_NOATIME                    # avoids access time updates, only allowed to the file owner
+        self.skip_classify_under = skip_classify_under
 
         # Data storage for analysis results
-        self.file_types = defaultdict(list)
+        self.file_types = Counter()                       # number of files per category
         self.file_sizes = defaultdict(int)
         self.large_files = []
         self.unusual_permissions = []
+        self.streamed = False                             # large and unusual files were written during traversal
+
+    def _get_magic(self) -> magic.Magic:
+        """
+        Get libmagic handle of the current thread, creating it on first use
+
+        :return: libmagic handle detecting mime types
+        """
+        file_type_magic = getattr(self._magic_local, 'magic', None)
+        if file_type_magic is None:
+            file_type_magic = self._magic_local.magic = magic.Magic(mime=True)
+        return file_type_magic
+
+    @property
+    def file_type_magic(self) -> magic.Magic:
+        """
+        libmagic handle of the current thread
+        """
+        return self._get_magic()
+
+    def categorize_file_type(self, file_path: str, size: int = None) -> str:
+        """
+        Categorize file type by extension, falling back to libmagic for unknown extensions
+
+        :param file_path: Path to the file
+        :param size: Already known size of the file, enables the small and empty file shortcuts
+        :return: Categorized file type
+        """
+        if size is not None and size < self.skip_classify_under:
+            return 'Small'
+
+        # Fast path for known and already classified extensions, no need to read the file
+        ext = os.path.splitext(file_path)[1].lower()
+        category = self._EXT_CATEGORY.get(ext) or self._ext_cache.get(ext)
+        if category:
+            return category
 
-    def categorize_file_type(self, file_path: str) -> str:
+        # libmagic can't tell anything about empty files
+        if size == 0:
+            return 'Other'
+
+        category = self.classify_with_magic(file_path)
+
+        # Files without extension have nothing in common, so they are never cached
+        if self.cache_by_extension and ext and category != 'Unknown':
+            self._ext_cache[ext] = category
+        return category
+
+    def classify_with_magic(self, file_path: str) -> str:
         """
         Categorize file type using libmagic
 
         :param file_path: Path to the file
         :return: Categorized file type
         """
+        # Flags of this attempt, other threads may clear the shared attribute meanwhile
+        flags = self._open_flags
         try:
-            # Getting mime type
-            mime_type = self.file_type_magic.from_file(file_path)
-
-            # Mapping mime types to categories
-            categories = {
-                'text': 'Text',
-                'image': 'Image',
-                'exec': 'Executable',
-                'video': 'Video',
-                'audio': 'Audio',
-                'application/pdf': 'PDF'
-            }
-
-            if not mime_type:
+            header = self.read_header(file_path, flags=flags)
+        except PermissionError as e:
+            if e.errno != errno.EPERM or not flags & O_NOATIME:
                 return 'Unknown'
+            # O_NOATIME is refused for files of other owners, stop requesting it for later files
+            # instead of failing the first open of every such file
+            self._open_flags = 0
+            try:
+                header = self.read_header(file_path)
+            except OSError:
+                return 'Unknown'
+        except OSError:
+            return 'Unknown'
 
-            # Check each key in mime_type
-            for key, category in categories.items():
-                if key in mime_type:
-                    return category
-                # Extra check for '.txt' files, because when text file is empty, mimi type return different type than text
-                elif os.path.splitext(file_path)[1] == '.txt':
-                    return 'Text'
-
-            # Default category
-            return 'Other'
+        # libmagic is the only remaining call that may raise
+        try:
+            mime_type = self._get_magic().from_buffer(header)
         except Exception:
             return 'Unknown'
 
+        if not mime_type:
+            return 'Unknown'
+
+        # Single scan of mime_type, lastindex tells which group matched
+        match = self._MIME_PATTERN.search(mime_type)
+        if match:
+            return self._MIME_CATEGORIES[match.lastindex - 1]
+
+        # Default category
+        return 'Other'
+
+    @staticmethod
+    def read_header(file_path: str, size: int = HEADER_SIZE, flags: int = 0) -> bytes:
+        """
+        Read the first bytes of a file with a single open/read/close
+
+        :param file_path: Path to the file
+        :param size: Number of bytes to read
+        :param flags: Extra os.open flags, e.g. O_NOATIME
+        :return: File header
+        """
+        fd = os.open(file_path, os.O_RDONLY | flags)
+        try:
+            return os.read(fd, size)
+        finally:
+            os.close(fd)
+
     @staticmethod
-    def analyze_permissions(file_path: str) -> bool:
+    def analyze_permissions(file_path: str, mode: int = None) -> bool:
         """
         Check for unusual file permissions
 
         :param file_path: Path to the file
+        :param mode: Already known st_mode of the file, skips the stat call
         :return: True if permissions are unusual, False otherwise
         """
         try:
-            file_stat = os.stat(file_path)
-            mode = file_stat.st_mode
+            if mode is None:
+                mode = os.stat(file_path).st_mode
 
             # Check for world-writable files
             if mode & stat.S_IWOTH:
@@ -79,62 +194,182 @@ class FileSystemAnalyzer:
         except Exception:
             return False
 
-    def traverse_directory(self):
+    def scan_files(self):
         """
-        Recursively traverse the directory and analyze files
-        """
-        try:
-            for root, dirs, files in os.walk(self.directory):
-                for file in files:
-                    full_path = os.path.join(root, file)
+        Iteratively walk the directory with os.scandir
 
-                    # Skip symlinks to prevent infinite loops
-                    if os.path.islink(full_path):
-                        continue
+        :return: Generator of (path, lstat result) pairs for regular files
+        """
+        pending = [self.directory]
+        while pending:
+            current = pending.pop()
+            try:
+                entries = os.scandir(current)
+            except PermissionError:
+                # Nested directories we can't access are skipped like os.walk does
+                if current == self.directory:
+                    print(f"Error: No permission to access directory {self.directory}")
+                continue
+            except Exception as e:
+                if current == self.directory:
+                    print(f"Unexpected error during directory traversal: {e}")
+                continue
 
+            with entries:
+                for entry in entries:
                     try:
-                        file_size = os.path.getsize(full_path)
-                        file_type = self.categorize_file_type(full_path)
-
-                        # Store file type information
-                        self.file_types[file_type].append(full_path)
-                        self.file_sizes[file_type] += file_size
+                        # Skip symlinks to prevent infinite loops, before any stat call.
+                        # The type comes from the directory listing, so no syscall is needed
+                        if entry.is_symlink():
+                            continue
 
-                        # Check for large files
-                        if file_size > self.size_threshold:
-                            self.large_files.append((full_path, file_size))
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                            continue
 
-                        # Check for unusual permissions
-                        if self.analyze_permissions(full_path):
-                            self.unusual_permissions.append(full_path)
+                        # Single lstat per file, cached on the DirEntry.
+                        # Type, size and mode are all taken from it.
+                        # Linux has no syscall returning metadata for a whole directory
+                        # (statx works on one path), so this is the minimum there
+                        file_stat = entry.stat(follow_symlinks=False)
+                        if stat.S_ISREG(file_stat.st_mode):
+                            yield entry.path, file_stat
 
                     except (PermissionError, OSError):
                         # Skip files we can't access
                         continue
 
-        except PermissionError:
-            print(f"Error: No permission to access directory {self.directory}")
-        except Exception as e:
-            print(f"Unexpected error during directory traversal: {e}")
+    @staticmethod
+    def unusual_mask(modes):
+        """
+        Check a batch of file modes for world-writable permissions
+
+        :param modes: Iterable of st_mode values
+        :return: Iterator of truthy values for world-writable modes, suitable for itertools.compress
+        """
+        # Bit test runs inside map, without a Python level call per file
+        return map(and_, modes, repeat(stat.S_IWOTH))
+
+    @staticmethod
+    def classify_metadata(sizes, modes, threshold: int):
+        """
+        Check a batch of file sizes and modes for large files and world-writable permissions
+
+        :param sizes: Iterable of file sizes
+        :param modes: Iterable of st_mode values
+        :param threshold: minimum file size to be considered large
+        :return: (large mask, permission mask) iterators, suitable for itertools.compress
+        """
+        return map(gt, sizes, repeat(threshold)), FileSystemAnalyzer.unusual_mask(modes)
+
+    def _walk_batches(self):
+        """
+        Walk the directory and classify files in batches of BATCH_SIZE
+
+        :return: Generator of (paths, sizes, modes, file types) parallel sequences
+        """
+        files = self.scan_files()
+
+        # libmagic releases the GIL while reading file headers, so threads scale well
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Directory enumeration stays on the calling thread.
+                # Metadata is kept as parallel arrays instead of a stat result per file
+                paths = []
+                sizes = array('q')
+                modes = array('L')
+                add_path, add_size, add_mode = paths.append, sizes.append, modes.append
+                for full_path, file_stat in islice(files, BATCH_SIZE):
+                    add_path(full_path)
+                    add_size(file_stat.st_size)
+                    add_mode(file_stat.st_mode)
+
+                if not paths:
+                    return
 
-    def generate_report(self):
+                yield paths, sizes, modes, list(executor.map(self.categorize_file_type, paths, sizes))
+
+    def walk(self):
+        """
+        Walk the directory and classify files, only one batch of files is held in memory
+
+        :return: Generator of (path, size, mode, file type) tuples
+        """
+        for batch in self._walk_batches():
+            yield from zip(*batch)
+
+    def traverse_directory(self, stream=None):
+        """
+        Traverse the directory and analyze files, classifying them in a thread pool
+
+        :param stream: text stream, when given large files and files with unusual permissions are
+                       written to it as soon as they are found instead of being kept for the report
+        """
+        self.streamed = stream is not None
+        type_counts, type_sizes = self.file_types, self.file_sizes
+
+        for paths, sizes, modes, file_types in self._walk_batches():
+            # Store file type information, lookups on self are hoisted out of the loop
+            for file_type, file_size in zip(file_types, sizes):
+                type_counts[file_type] += 1
+                type_sizes[file_type] += file_size
+
+            # Check for large files and world-writable files in one batch
+            large_mask, permission_mask = self.classify_metadata(sizes, modes, self.size_threshold)
+            large_files = compress(zip(paths, sizes), large_mask)
+            unusual_permissions = compress(paths, permission_mask)
+
+            if stream is None:
+                self.large_files.extend(large_files)
+                self.unusual_permissions.extend(unusual_permissions)
+            else:
+                stream.write(''.join([
+                    *(f"Large file: {file}: {size * MB_PER_BYTE:.2f} MB\n" for file, size in large_files),
+                    *(f"Unusual permissions: {file}\n" for file in unusual_permissions),
+                ]))
+
+    def files_of_type(self, file_type: str):
+        """
+        Walk the directory again and find files of the given category.
+        Files are re-classified sequentially, without the thread pool. With the extension cache
+        active, results may disagree with file_types counted during the first walk, since cached
+        categories can differ from what libmagic would report for every single file
+
+        :param file_type: Category name as reported in file_types
+        :return: Generator of paths
+        """
+        for full_path, file_stat in self.scan_files():
+            if self.categorize_file_type(full_path, file_stat.st_size) == file_type:
+                yield full_path
+
+    def generate_report(self, top: int = None):
         """
         Generate a comprehensive report of the file system analysis
+
+        :param top: show only this many of the largest files (default: all)
         """
-        print("\n=== File System Analysis Report ===")
-        print(f"Directory Analyzed: {self.directory}\n")
+        # Report is collected into a list and written to stdout at once
+        out = ["\n=== File System Analysis Report ===\n", f"Directory Analyzed: {self.directory}\n\n"]
 
         # File Type Distribution
-        print("File Type Distribution:")
-        for file_type, files in self.file_types.items():
-            print(f"{file_type}: {len(files)} files, Total Size: {self.file_sizes[file_type] / (1024 * 1024):.4f} MB")
-
-        # Large Files
-        print("\nLarge Files (> {} MB):".format(self.size_threshold / (1024 * 1024)))
-        for file, size in sorted(self.large_files, key=lambda x: x[1], reverse=True):
-            print(f"{file}: {size / (1024 * 1024):.2f} MB")
-
-        # Unusual Permissions
-        print("\nFiles with Unusual Permissions:")
-        for file in self.unusual_permissions:
-            print(file)
\ No newline at end of file
+        out.append("File Type Distribution:\n")
+        for file_type, count in self.file_types.items():
+            out.append(f"{file_type}: {count} files, "
+                       f"Total Size: {self.file_sizes[file_type] * MB_PER_BYTE:.4f} MB\n")
+
+        # Large files and unusual permissions are already printed when streamed
+        if not self.streamed:
+            # Large Files
+            out.append(f"\nLarge Files (> {self.size_threshold * MB_PER_BYTE} MB):\n")
+            if top is None:
+                largest = sorted(self.large_files, key=itemgetter(1), reverse=True)
+            else:
+                # Partial selection instead of sorting the whole list
+                largest = heapq.nlargest(top, self.large_files, key=itemgetter(1))
+            out.extend(f"{file}: {size * MB_PER_BYTE:.2f} MB\n" for file, size in largest)
+
+            # Unusual Permissions
+            out.append("\nFiles with Unusual Permissions:\n")
+            out.extend(f"{file}\n" for file in self.unusual_permissions)
+
+        sys.stdout.write(''.join(out))
@@ -10,22 +10,47 @@ def main():
     parser.add_argument('directory', type=str, help='Directory to analyze')
     parser.add_argument('-t', '--threshold', type=int, default=100,
                         help='Large file size threshold in MB (default: 100)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of threads used to classify files (default: min(32, 4 * CPU count))')
+    parser.add_argument('--no-ext-cache', action='store_true',
+                        help='Run libmagic on every file instead of once per unknown extension')
+    parser.add_argument('--skip-classify-under', type=int, default=0, metavar='BYTES',
+                        help="Count files smaller than BYTES as 'Small' without classifying them (default: 0)")
+    parser.add_argument('--top', type=int, default=None, metavar='N',
+                        help='Show only N largest files in the report (default: all)')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Print large files and unusual permissions unsorted, as they are found, instead of '
+                             'keeping them for the report (not compatible with --top)')
 
     # Parse arguments
     args = parser.parse_args()
 
-    # Convert threshold to bytes
-    size_threshold = args.threshold * 1024 * 1024
-
-    # Validate directory
+    # Validate arguments before doing any work
     if not os.path.isdir(args.directory):
         print(f"Error: {args.directory} is not a valid directory")
         sys.exit(1)
+    if args.threshold < 0:
+        print("Error: threshold can't be negative")
+        sys.exit(1)
+    if args.workers is not None and args.workers < 1:
+        print("Error: number of workers must be at least 1")
+        sys.exit(1)
+    if args.top is not None and args.top < 0:
+        print("Error: number of largest files can't be negative")
+        sys.exit(1)
+    if args.top is not None and args.stream:
+        print("Error: --top can't be used with --stream, streamed files are printed unsorted as they are found")
+        sys.exit(1)
+
+    # Convert threshold to bytes once
+    size_threshold = args.threshold * 1024 * 1024
 
     # Create and run analyzer
-    analyzer = FileSystemAnalyzer(args.directory, size_threshold)
-    analyzer.traverse_directory()
-    analyzer.generate_report()
+    analyzer = FileSystemAnalyzer(args.directory, size_threshold, args.workers,
+                                  cache_by_extension=not args.no_ext_cache,
+                                  skip_classify_under=args.skip_classify_under)
+    analyzer.traverse_directory(sys.stdout if args.stream else None)
+    analyzer.generate_report(args.top)
 
 
 if __name__ == '__main__':
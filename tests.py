@@ -1,9 +1,13 @@
+import errno
+import io
 import os
 import shutil
 import tempfile
 import unittest
+from contextlib import redirect_stdout
+from unittest import mock
 from PIL import Image
-from file_system_analyzer import FileSystemAnalyzer
+from file_system_analyzer import HEADER_SIZE, O_NOATIME, FileSystemAnalyzer
 
 
 
@@ -55,6 +59,18 @@ class TestFileSystemAnalyzer(unittest.TestCase):
         self.assertIn('Text', analyzer.file_types)
         self.assertIn('Image', analyzer.file_types)
 
+    def test_worker_count(self):
+        """
+        Testing that results don't depend on number of classification threads
+        """
+        single = FileSystemAnalyzer(self.test_dir, max_workers=1)
+        single.traverse_directory()
+        pool = FileSystemAnalyzer(self.test_dir, max_workers=8)
+        pool.traverse_directory()
+
+        self.assertEqual(single.file_types, pool.file_types)
+        self.assertEqual(single.file_sizes, pool.file_sizes)
+
     def test_categorize_file_type(self):
         """
         Testing for right file categorization
@@ -68,6 +84,94 @@ class TestFileSystemAnalyzer(unittest.TestCase):
         self.assertEqual(analyzer.categorize_file_type(text_file), 'Text')
         self.assertEqual(analyzer.categorize_file_type(image_file), 'Image')  # Должно пройти
 
+    def test_unknown_extension(self):
+        """
+        Testing that files with unknown extension are classified by libmagic from their header
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir)
+
+        unknown_file = os.path.join(self.test_dir, 'notes.unknownext')
+        with open(unknown_file, 'w') as f:
+            f.write('This is test text file.')
+
+        self.assertEqual(analyzer.categorize_file_type(unknown_file), 'Text')
+
+    def test_read_header(self):
+        """
+        Testing that only file header is read
+        """
+        large_file = os.path.join(self.test_dir, 'large_file.bin')
+        text_file = os.path.join(self.test_dir, 'text1.txt')
+
+        self.assertEqual(len(FileSystemAnalyzer.read_header(large_file)), HEADER_SIZE)
+        self.assertEqual(FileSystemAnalyzer.read_header(text_file), b'This is test text file.')
+
+    @unittest.skipUnless(O_NOATIME, 'O_NOATIME is not available on this platform')
+    def test_noatime_fallback(self):
+        """
+        Testing that file is read without O_NOATIME when it is refused, even if another thread already cleared it
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir, cache_by_extension=False)
+        text_file = os.path.join(self.test_dir, 'notes.unknownext')
+        with open(text_file, 'w') as f:
+            f.write('This is test text file.')
+
+        def refuse_noatime(file_path, size=HEADER_SIZE, flags=0):
+            if flags & O_NOATIME:
+                # Another thread got EPERM first and cleared the flag
+                analyzer._open_flags = 0
+                raise PermissionError(errno.EPERM, os.strerror(errno.EPERM), file_path)
+            with open(file_path, 'rb') as f:
+                return f.read(size)
+
+        with mock.patch.object(FileSystemAnalyzer, 'read_header', side_effect=refuse_noatime):
+            self.assertEqual(analyzer.categorize_file_type(text_file), 'Text')
+            self.assertEqual(analyzer._open_flags, 0)
+            self.assertEqual(analyzer.categorize_file_type(text_file), 'Text')
+
+    def test_extension_cache(self):
+        """
+        Testing that libmagic result is reused for files with the same extension
+        """
+        text_file = os.path.join(self.test_dir, 'first.dat')
+        binary_file = os.path.join(self.test_dir, 'second.dat')
+        with open(text_file, 'w') as f:
+            f.write('This is test text file.')
+        with open(binary_file, 'wb') as f:
+            f.write(b'\x00' * 1024)
+
+        # With cache second file gets category of the first one
+        analyzer = FileSystemAnalyzer(self.test_dir)
+        self.assertEqual(analyzer.categorize_file_type(text_file), 'Text')
+        self.assertEqual(analyzer.categorize_file_type(binary_file), 'Text')
+
+        # Without cache every file is checked by libmagic
+        analyzer = FileSystemAnalyzer(self.test_dir, cache_by_extension=False)
+        self.assertEqual(analyzer.categorize_file_type(text_file), 'Text')
+        self.assertEqual(analyzer.categorize_file_type(binary_file), 'Other')
+
+    def test_files_of_type(self):
+        """
+        Testing that paths of a category are found by walking again
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir)
+        analyzer.traverse_directory()
+
+        text_files = sorted(os.path.basename(path) for path in analyzer.files_of_type('Text'))
+        self.assertEqual(text_files, ['text1.txt', 'writable_file.txt'])
+
+    def test_skip_classify_under(self):
+        """
+        Testing that small files are not classified
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir, skip_classify_under=1024)
+        analyzer.traverse_directory()
+
+        # Only large file is big enough to be classified
+        self.assertEqual(analyzer.file_types['Small'], 3)
+        self.assertNotIn('Text', analyzer.file_types)
+        self.assertNotIn('Image', analyzer.file_types)
+
     def test_large_file_detection(self):
         """
         Testing large files
@@ -92,6 +196,45 @@ class TestFileSystemAnalyzer(unittest.TestCase):
         self.assertEqual(len(analyzer.unusual_permissions), 1)
         self.assertTrue(analyzer.unusual_permissions[0].endswith('writable_file.txt'))
 
+    def test_analyze_permissions_symlink(self):
+        """
+        Testing that symlink is checked by permissions of its target
+        """
+        text_file = os.path.join(self.test_dir, 'text1.txt')
+        os.chmod(text_file, 0o644)
+        link = os.path.join(self.test_dir, 'link.txt')
+        os.symlink(text_file, link)
+
+        self.assertFalse(FileSystemAnalyzer.analyze_permissions(link))
+
+    def test_walk(self):
+        """
+        Testing (path, size, mode, category) tuples produced by walk
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir)
+        files = {os.path.basename(path): (size, mode, file_type)
+                 for path, size, mode, file_type in analyzer.walk()}
+
+        self.assertEqual(len(files), 4)
+        self.assertEqual(files['large_file.bin'][0], 150 * 1024 * 1024)
+        self.assertEqual(files['text1.txt'][2], 'Text')
+        self.assertEqual(files['image.png'][2], 'Image')
+        self.assertTrue(files['writable_file.txt'][1] & 0o002)
+
+    def test_stream_results(self):
+        """
+        Testing that large and world-writable files are written to stream instead of being kept
+        """
+        stream = io.StringIO()
+        analyzer = FileSystemAnalyzer(self.test_dir)
+        analyzer.traverse_directory(stream)
+
+        output = stream.getvalue()
+        self.assertIn('large_file.bin', output)
+        self.assertIn('writable_file.txt', output)
+        self.assertEqual(analyzer.large_files, [])
+        self.assertEqual(analyzer.unusual_permissions, [])
+
     def test_generate_report(self):
         """
         Testing report generation
@@ -105,6 +248,22 @@ class TestFileSystemAnalyzer(unittest.TestCase):
         except Exception as e:
             self.fail(f"generate_report() create exception: {e}")
 
+    def test_generate_report_top(self):
+        """
+        Testing that report shows only requested number of the largest files
+        """
+        analyzer = FileSystemAnalyzer(self.test_dir, size_threshold=10)
+        analyzer.traverse_directory()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            analyzer.generate_report(top=1)
+
+        large_section = output.getvalue().split('Large Files')[1].split('Files with Unusual Permissions')[0]
+        self.assertIn('large_file.bin', large_section)
+        self.assertNotIn('text1.txt', large_section)
+        self.assertNotIn('image.png', large_section)
+
     def test_error_handling(self):
         """
         Testing error handling for some directories